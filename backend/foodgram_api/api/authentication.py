@@ -0,0 +1,20 @@
+from recipes.cache import token_cache, token_digest
+from rest_framework.authentication import TokenAuthentication
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для токенов из кэша.
+
+    Кэшируются только действующие токены активных пользователей; сигналы
+    сбрасывают их при удалении токена (выход через djoser) и при
+    изменении пользователя. Другие процессы видят сброс с задержкой до
+    AUTH_TOKEN_LOCAL_TIMEOUT секунд, см. recipes.cache.TokenCache.
+    """
+
+    def authenticate_credentials(self, key):
+        digest = token_digest(key)
+        token = token_cache.get(digest)
+        if token is None:
+            _, token = super().authenticate_credentials(key)
+            token_cache.set(digest, token)
+        return token.user, token
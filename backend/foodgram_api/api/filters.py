@@ -1,28 +1,108 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipe, Tag
+from recipes.cache import TAGS_VERSION_KEY, get_version
+from recipes.fulltext import search
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from rest_framework.filters import BaseFilterBackend
+
+from .search import ingredient_index, search_ingredients
+
+tag_ids_cache = {}
+
+
+def get_tag_ids():
+    """Соответствие slug -> id тегов, хранится до смены версии тегов."""
+    version = get_version(TAGS_VERSION_KEY)
+    if tag_ids_cache.get('version') != version:
+        tag_ids_cache['tag_ids'] = dict(
+            Tag.objects.values_list('slug', 'id'))
+        tag_ids_cache['version'] = version
+    return tag_ids_cache['tag_ids']
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    ORDERINGS = {
+        'popular': ('-favorites_count', '-id'),
+        'trending': ('-trending_score', '-id'),
+        'cooking_time': ('cooking_time', 'id'),
+    }
+
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')),
+        method='get_tags_mode',
     )
     is_favorited = filters.NumberFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in ORDERINGS],
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',)
+        fields = ('tags', 'tags_mode', 'author', 'is_favorited',
+                  'is_in_shopping_cart', 'search', 'ordering',)
+
+    def get_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        tags = Recipe.tags.through.objects.filter(recipe=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            for slug in value:
+                queryset = queryset.filter(
+                    Exists(tags.filter(tag_id=tag_ids[slug])))
+            return queryset
+        return queryset.filter(Exists(tags.filter(
+            tag_id__in=[tag_ids[slug] for slug in value])))
+
+    def get_tags_mode(self, queryset, name, value):
+        return queryset
 
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user, recipe=OuterRef('pk'))))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_list__user=self.request.user)
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=self.request.user, recipe=OuterRef('pk'))))
+        return queryset
+
+    def get_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*self.ORDERINGS[value])
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиентов по названию через индекс в памяти процесса или,
+    если он отключён настройкой INGREDIENT_INDEX, запросом к базе."""
+    search_params = ('name', 'search')
+
+    def filter_queryset(self, request, queryset, view):
+        if view.action != 'list':
+            return queryset
+        for param in self.search_params:
+            query = request.query_params.get(param, '').strip()
+            if not query:
+                continue
+            if settings.INGREDIENT_INDEX:
+                return ingredient_index.search(query)
+            return search_ingredients(queryset, query)
         return queryset
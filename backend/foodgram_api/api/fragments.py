@@ -0,0 +1,94 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from recipes.cache import (INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY,
+                           get_versions, is_shared, recipe_version_keys)
+from recipes.models import Follow, Recipe
+
+from .rows import recipe_cards
+from .serializers import RecipeReadSerializer
+
+FRAGMENT_KEY = 'recipe:fragment:{recipe_id}:{version}:{context}'
+# Ограничивает срок, на который карточка может пережить потерянную
+# смену версии (например, при вытеснении ключа версии из кэша).
+FRAGMENT_TIMEOUT = 10 * 60
+
+
+def get_fragment_keys(recipe_ids, request):
+    """Ключ карточки зависит от версии рецепта, версий справочников тегов
+    и ингредиентов и адреса сайта: ссылки на изображения абсолютные."""
+    version_keys = recipe_version_keys(recipe_ids)
+    versions = get_versions(
+        [*version_keys.values(), TAGS_VERSION_KEY, INGREDIENTS_VERSION_KEY])
+    context = md5(
+        f'{versions[TAGS_VERSION_KEY]}:{versions[INGREDIENTS_VERSION_KEY]}:'
+        f'{request.build_absolute_uri("/")}'.encode()
+    ).hexdigest()
+    return {
+        recipe_id: FRAGMENT_KEY.format(
+            recipe_id=recipe_id, version=versions[key], context=context)
+        for recipe_id, key in version_keys.items()
+    }
+
+
+def build_cards(recipe_ids, request):
+    """Карточки рецептов без флагов пользователя."""
+    if settings.FAST_JSON:
+        return recipe_cards(recipe_ids, request).values()
+    return RecipeReadSerializer(
+        Recipe.objects.for_read(AnonymousUser()).filter(pk__in=recipe_ids),
+        many=True,
+        context={'request': request},
+    ).data
+
+
+def serialize_recipes(recipes, request):
+    """Данные RecipeReadSerializer для рецептов из общих карточек в кэше.
+
+    Карточки сериализуются без учёта пользователя, его флаги берутся из
+    аннотаций with_user_flags у recipes и одного запроса подписок. Если
+    кэш не общий (LocMemCache), смену версии после правки в другом
+    процессе не видно, и карточки строятся заново на каждый запрос.
+    """
+    recipe_ids = [recipe.pk for recipe in recipes]
+    if is_shared():
+        keys = get_fragment_keys(recipe_ids, request)
+        fragments = cache.get_many(list(keys.values()))
+        missing = [
+            recipe_id for recipe_id, key in keys.items()
+            if key not in fragments
+        ]
+    else:
+        keys = {recipe_id: recipe_id for recipe_id in recipe_ids}
+        fragments = {}
+        missing = recipe_ids
+    if missing:
+        fresh = {
+            keys[item['id']]: dict(item)
+            for item in build_cards(missing, request)
+        }
+        if is_shared():
+            cache.set_many(fresh, FRAGMENT_TIMEOUT)
+        fragments.update(fresh)
+    subscribed = set()
+    if request.user.is_authenticated:
+        subscribed = set(Follow.objects.filter(
+            user=request.user,
+            author_id__in={recipe.author_id for recipe in recipes},
+        ).values_list('author_id', flat=True))
+    data = []
+    for recipe in recipes:
+        fragment = fragments.get(keys[recipe.pk])
+        if fragment is None:
+            continue
+        item = dict(fragment)
+        item['author'] = {
+            **fragment['author'],
+            'is_subscribed': recipe.author_id in subscribed,
+        }
+        item['is_favorited'] = recipe.is_favorited
+        item['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+        data.append(item)
+    return data
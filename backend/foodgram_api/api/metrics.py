@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SLOW_QUERIES_LOGGED = 5
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PLACEHOLDERS_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+current = ContextVar('request_metrics', default=None)
+
+
+def fingerprint(sql):
+    """Запросы, отличающиеся только числом параметров в IN (...),
+    считаются одинаковыми."""
+    return PLACEHOLDERS_RE.sub('(...)', sql)
+
+
+class RequestRecord:
+    """Запросы и время рендеринга одного HTTP-запроса."""
+
+    def __init__(self):
+        self.queries = []
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def duplicates(self):
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+    def top_queries(self, limit=SLOW_QUERIES_LOGGED):
+        totals = defaultdict(lambda: [0, 0.0])
+        for sql, duration in self.queries:
+            total = totals[fingerprint(sql)]
+            total[0] += 1
+            total[1] += duration
+        return sorted(
+            totals.items(), key=lambda item: item[1][1], reverse=True
+        )[:limit]
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Каждый воркер gunicorn собирает свои метрики, Prometheus опрашивает
+    их по отдельности или через агрегирующий прокси.
+    """
+    HISTOGRAMS = (
+        ('foodgram_request_duration_seconds',
+         'Время обработки запроса.', DURATION_BUCKETS),
+        ('foodgram_request_db_seconds',
+         'Время SQL-запросов за один запрос.', DURATION_BUCKETS),
+        ('foodgram_request_render_seconds',
+         'Время рендеринга ответа.', DURATION_BUCKETS),
+        ('foodgram_request_queries',
+         'Число SQL-запросов за один запрос.', QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(dict)
+        self.duplicates = Counter()
+
+    def observe(self, view, method, record, duration):
+        values = (duration, record.db_time, record.render_time,
+                  len(record.queries))
+        with self.lock:
+            for (name, _, buckets), value in zip(self.HISTOGRAMS, values):
+                histogram = self.histograms[name].get((view, method))
+                if histogram is None:
+                    histogram = Histogram(buckets)
+                    self.histograms[name][(view, method)] = histogram
+                histogram.observe(value)
+            for sql, count in record.duplicates().items():
+                digest = hashlib.md5(sql.encode()).hexdigest()[:12]
+                self.duplicates[(view, digest)] += count - 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, description, _ in self.HISTOGRAMS:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (view, method), histogram in sorted(
+                        self.histograms[name].items()):
+                    lines.extend(histogram.render(
+                        name, f'view="{view}",method="{method}"'))
+            name = 'foodgram_duplicate_queries_total'
+            lines.append(f'# HELP {name} Повторы одного и того же запроса.')
+            lines.append(f'# TYPE {name} counter')
+            for (view, digest), count in sorted(self.duplicates.items()):
+                lines.append(
+                    f'{name}{{view="{view}",fingerprint="{digest}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@contextmanager
+def render_timer():
+    """Учитывает время рендеринга ответа, если метрики запроса включены
+    (см. api.renderers)."""
+    record = current.get()
+    if record is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.render_time += time.perf_counter() - started
+
+
+class QueryMetricsMiddleware:
+    """Считает SQL-запросы, время БД и рендеринга для запросов к api.
+
+    Включается настройкой REQUEST_METRICS; без неё Django исключает
+    middleware из цепочки при старте.
+    """
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        record = RequestRecord()
+        token = current.set(record)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        if (match is not None and match.app_name == 'api'
+                and match.url_name != 'metrics'):
+            registry.observe(match.view_name, request.method, record, duration)
+            if duration * 1000 >= settings.SLOW_REQUEST_MS:
+                self.log_slow_request(request, record, duration)
+        return response
+
+    @staticmethod
+    def log_slow_request(request, record, duration):
+        top = '\n'.join(
+            f'  {count} x {total * 1000:.1f} мс: {sql}'
+            for sql, (count, total) in record.top_queries()
+        )
+        logger.warning(
+            'Медленный запрос %s %s: %.0f мс, %d SQL-запросов за %.0f мс, '
+            'рендеринг %.0f мс\n%s',
+            request.method, request.get_full_path(), duration * 1000,
+            len(record.queries), record.db_time * 1000,
+            record.render_time * 1000, top,
+        )
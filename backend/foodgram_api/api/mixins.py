@@ -0,0 +1,133 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                quote_etag)
+from recipes.cache import get_version
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .pagination import KeysetPagination
+
+CATALOGUE_CACHE_KEY = 'catalogue:{name}:{version}'
+CATALOGUE_MAX_AGE = 60
+
+
+class CachedCatalogueMixin:
+    """Кэширует полный список справочника, который меняется через админку.
+
+    Сериализованный список хранится в памяти процесса и в общем кэше под
+    ключом с версией каталога; сигналы моделей меняют версию. Ответы
+    снабжаются ETag, чтобы фронтенд и nginx могли их переиспользовать.
+    """
+    catalogue_version_key = None
+    local_cache = {}
+
+    def list(self, request, *args, **kwargs):
+        version = get_version(self.catalogue_version_key)
+        query = md5(request.GET.urlencode().encode()).hexdigest()
+        etag = quote_etag(f'{self.basename}-{version}-{query}')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if request.GET:
+                response = super().list(request, *args, **kwargs)
+            else:
+                response = Response(self.get_catalogue(version))
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=CATALOGUE_MAX_AGE)
+        return response
+
+    def get_catalogue(self, version):
+        cached = self.local_cache.get(self.basename)
+        if cached and cached[0] == version:
+            return cached[1]
+        key = CATALOGUE_CACHE_KEY.format(name=self.basename, version=version)
+        data = cache.get(key)
+        if data is None:
+            data = self.get_catalogue_data()
+            cache.set(key, data, timeout=None)
+        self.local_cache[self.basename] = (version, data)
+        return data
+
+    def get_catalogue_data(self):
+        """Поля простого ModelSerializer справочника читаются .values()
+        в том же порядке ключей."""
+        if settings.FAST_JSON:
+            return list(self.get_queryset().values(
+                *self.get_serializer_class().Meta.fields))
+        return self.get_serializer(self.get_queryset(), many=True).data
+
+
+class KeysetPaginationMixin:
+    """Включает курсорную пагинацию, если в запросе есть параметр cursor.
+
+    Первая страница запрашивается с пустым курсором: ?cursor=
+    """
+    keyset_ordering = None
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.cursor_query_param in self.request.GET:
+                self._paginator = KeysetPagination(
+                    self.get_keyset_ordering())
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+
+class SparseFieldsMixin:
+    """Параметры запроса fields, omit и expand для ответов на чтение.
+
+    fields и omit перечисляют через запятую поля, которые нужно оставить
+    или убрать. expand перечисляет вложенные объекты, которые отдаются
+    целиком: без параметра развёрнуты все, с пустым expand= вместо
+    объектов отдаются их идентификаторы.
+    """
+    sparse_actions = ('list', 'retrieve')
+    sparse_params = ('fields', 'omit', 'expand')
+
+    @staticmethod
+    def parse_names(params, param, allowed):
+        names = [
+            name.strip() for name in params[param].split(',') if name.strip()
+        ]
+        unknown = set(names) - set(allowed)
+        if unknown:
+            raise ValidationError({param: (
+                f'Неизвестные поля: {", ".join(sorted(unknown))}. '
+                f'Доступные: {", ".join(allowed)}.'
+            )})
+        return names
+
+    def get_sparse_fields(self, serializer_class=None):
+        """Поля ответа и развёрнутые объекты или None, если в запросе нет
+        параметров и ответ полный."""
+        params = self.request.query_params
+        if (self.request.method != 'GET'
+                or self.action not in self.sparse_actions
+                or not any(param in params for param in self.sparse_params)):
+            return None
+        meta = (serializer_class or self.get_serializer_class()).Meta
+        fields = meta.fields
+        expandable = tuple(getattr(meta, 'collapsed_fields', ()))
+        if params.get('fields'):
+            fields = self.parse_names(params, 'fields', fields)
+        if 'omit' in params:
+            omit = self.parse_names(params, 'omit', meta.fields)
+            fields = [name for name in fields if name not in omit]
+        expand = expandable
+        if 'expand' in params:
+            expand = self.parse_names(params, 'expand', expandable)
+        return frozenset(fields), frozenset(expand)
+
+    def get_serializer(self, *args, **kwargs):
+        sparse = self.get_sparse_fields()
+        if sparse is not None:
+            kwargs['fields'], kwargs['expand'] = sparse
+        return super().get_serializer(*args, **kwargs)
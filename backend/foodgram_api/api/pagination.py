@@ -1,6 +1,121 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from recipes.feed import feed_recipe_ids
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class Pagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по набору полей без OFFSET и COUNT(*).
+
+    Курсор хранит значения полей ordering последнего объекта страницы,
+    следующая страница выбирается лексикографическим сравнением с ними.
+    Последнее поле ordering должно быть уникальным.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        results = self.get_results(queryset, position, page_size + 1)
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_results(self, queryset, position, limit):
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        return list(queryset[:limit])
+
+    def get_position_filter(self, position):
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError('Неверное число полей в курсоре.')
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError) as error:
+            raise NotFound(self.invalid_cursor_message) from error
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1]),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+
+class FeedPagination(KeysetPagination):
+    """Лента подписок: id рецептов страницы выбираются из записей
+    FeedItem и рецептов популярных авторов (recipes.feed), а сами
+    рецепты читаются из queryset представления одним запросом."""
+
+    def __init__(self):
+        super().__init__(('-pub_date', '-id'))
+
+    def get_results(self, queryset, position, limit):
+        recipe_ids = feed_recipe_ids(self.request.user, limit, position)
+        recipes = queryset.in_bulk(recipe_ids)
+        return [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
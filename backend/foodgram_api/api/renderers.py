@@ -0,0 +1,47 @@
+import orjson
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import render_timer
+
+# Те же байты, что у JSONRenderer с настройками по умолчанию: компактный
+# вывод, не-ASCII символы как есть. Даты и прочие нестандартные типы
+# отдаются в кодировщик DRF, чтобы совпадал их формат. Ошибки ListField
+# приходят словарём с целыми ключами, json превращает их в строки.
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME
+                  | orjson.OPT_PASSTHROUGH_DATACLASS
+                  | orjson.OPT_NON_STR_KEYS)
+LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer DRF, время рендеринга попадает в метрики запроса."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with render_timer():
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson. С отступами (браузерный api, ?indent=)
+    рендерит стандартный JSONRenderer."""
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        with render_timer():
+            ret = orjson.dumps(
+                data, default=self.encoder.default, option=ORJSON_OPTIONS)
+            # Как и JSONRenderer, экранируем разделители строк для
+            # JavaScript.
+            for char, escaped in LINE_SEPARATORS:
+                ret = ret.replace(char, escaped)
+        return ret
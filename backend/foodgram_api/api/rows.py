@@ -0,0 +1,126 @@
+from collections import defaultdict
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from recipes.models import IngredientRecipe, Recipe
+
+# Построение ответов из .values() без сериализаторов DRF. Форма и порядок
+# ключей совпадают с RecipeReadSerializer и SubscribeSerializer.
+
+storage = Recipe._meta.get_field('image').storage
+
+
+def file_url(name, request=None):
+    """Как FileField.to_representation: абсолютная ссылка при наличии
+    request, иначе относительная."""
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def image_variant_urls(variants, image, request=None):
+    """Ссылки на копии изображения, если они относятся к текущему."""
+    if variants.get('source') != image:
+        return {}
+    return {
+        variant: file_url(path, request)
+        for variant, path in variants.items() if variant != 'source'
+    }
+
+
+def recipe_cards(recipe_ids, request):
+    """Карточки рецептов без флагов пользователя (все флаги False)."""
+    tags = defaultdict(list)
+    for row in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+    ):
+        tags[row['recipe_id']].append({
+            'id': row['tag_id'],
+            'name': row['tag__name'],
+            'color': row['tag__color'],
+            'slug': row['tag__slug'],
+        })
+    ingredients = defaultdict(list)
+    for row in IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount',
+    ):
+        ingredients[row['recipe_id']].append({
+            'id': row['ingredient_id'],
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['amount'],
+        })
+    cards = {}
+    for row in Recipe.objects.filter(pk__in=recipe_ids).values(
+        'id', 'name', 'image', 'image_variants', 'text', 'cooking_time',
+        'author_id', 'author__email', 'author__username',
+        'author__first_name', 'author__last_name',
+    ):
+        cards[row['id']] = {
+            'id': row['id'],
+            'tags': tags[row['id']],
+            'author': {
+                'email': row['author__email'],
+                'id': row['author_id'],
+                'username': row['author__username'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'is_subscribed': False,
+            },
+            'ingredients': ingredients[row['id']],
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': row['name'],
+            'image': file_url(row['image'], request),
+            'image_variants': image_variant_urls(
+                row['image_variants'], row['image'], request),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+    return cards
+
+
+def subscription_rows(authors, recipes_limit):
+    """Авторы из подписок с последними recipes_limit рецептами.
+
+    Как и в SubscribeSerializer, ссылки на изображения относительные.
+    """
+    recipes = defaultdict(list)
+    for row in Recipe.objects.filter(
+        author__in=authors
+    ).annotate(
+        row_number=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=F('pub_date').desc(),
+        )
+    ).filter(row_number__lte=recipes_limit).order_by('-pub_date').values(
+        'id', 'author_id', 'name', 'image', 'image_variants', 'cooking_time'
+    ):
+        recipes[row['author_id']].append({
+            'id': row['id'],
+            'name': row['name'],
+            'image': file_url(row['image']),
+            'image_variants': image_variant_urls(
+                row['image_variants'], row['image']),
+            'cooking_time': row['cooking_time'],
+        })
+    return [
+        {
+            'email': author.email,
+            'id': author.id,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': True,
+            'recipes_count': author.recipes_count,
+            'recipes': recipes[author.id],
+        }
+        for author in authors
+    ]
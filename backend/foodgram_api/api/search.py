@@ -0,0 +1,190 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Lower
+from recipes.cache import (INGREDIENTS_VERSION_KEY, get_recipe_changes,
+                           get_recipe_changes_seq, get_version)
+from recipes.models import Ingredient, IngredientRecipe
+
+SEARCH_LIMIT = 50
+MAX_INCREMENTAL_CHANGES = 1000
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для поиска по мере ввода.
+
+    Названия хранятся отсортированными в нижнем регистре: совпадения по
+    началу находятся бинарным поиском, вхождения в середину - поиском
+    подстроки по склеенному тексту всех названий. Индекс перестраивается,
+    когда меняется версия каталога в кэше.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.data = ((), (), '', ())
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            rows = sorted(
+                Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'),
+                key=lambda row: (row[1].casefold(), row[0]),
+            )
+            keys = [row[1].casefold() for row in rows]
+            offsets = []
+            position = 0
+            for key in keys:
+                offsets.append(position)
+                position += len(key) + 1
+            self.data = (keys, rows, '\n'.join(keys), offsets)
+            self.version = version
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Сначала совпадения по началу названия, затем по вхождению."""
+        self.refresh()
+        keys, rows, text, offsets = self.data
+        query = query.casefold().replace('\n', ' ')
+        start = bisect_left(keys, query)
+        end = min(bisect_right(keys, query + '\U0010ffff'), start + limit)
+        found = list(range(start, end))
+        position = text.find(query)
+        while position != -1 and len(found) < limit:
+            index = bisect_right(offsets, position) - 1
+            if not keys[index].startswith(query):
+                found.append(index)
+            position = text.find(query, offsets[index] + len(keys[index]))
+        return [
+            Ingredient(id=id, name=name, measurement_unit=measurement_unit)
+            for id, name, measurement_unit in (rows[i] for i in found)
+        ]
+
+
+def search_ingredients(queryset, query, limit=SEARCH_LIMIT):
+    """Поиск в базе в том же порядке, что и IngredientIndex.search.
+
+    На PostgreSQL icontains и istartswith сравнивают UPPER(name), и их
+    обслуживает триграммный индекс из миграции 0003.
+    """
+    return queryset.filter(name__icontains=query).annotate(
+        substring=Case(
+            When(name__istartswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('substring', Lower('name'), 'id')[:limit]
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс «ингредиент -> рецепты» для подбора рецептов по
+    имеющимся продуктам.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта - массив id его ингредиентов. Изменённые рецепты
+    подтягиваются по журналу в кэше; если журнал отстал, вытеснен или
+    начал новую эпоху, индекс перестраивается целиком.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.postings = {}
+        self.recipes = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        version = get_recipe_changes_seq()
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            epoch, seq = version
+            changes = None
+            if self.version is not None and self.version[0] == epoch:
+                last = self.version[1]
+                if 0 < seq - last <= MAX_INCREMENTAL_CHANGES:
+                    changes = get_recipe_changes(epoch, last, seq)
+            if changes is None:
+                self.rebuild()
+            else:
+                self.update(changes)
+            self.version = version
+
+    @staticmethod
+    def load(queryset):
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in queryset.values_list(
+                'recipe_id', 'ingredient_id').iterator():
+            recipes[recipe_id].add(ingredient_id)
+        return recipes
+
+    def rebuild(self):
+        postings = defaultdict(list)
+        recipes = {}
+        for recipe_id, ingredients in sorted(
+                self.load(IngredientRecipe.objects.all()).items()):
+            recipes[recipe_id] = array('I', sorted(ingredients))
+            for ingredient_id in ingredients:
+                postings[ingredient_id].append(recipe_id)
+        self.postings = {
+            ingredient_id: array('I', recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        self.recipes = recipes
+
+    def update(self, recipe_ids):
+        """Массивы затронутых ингредиентов заменяются новыми, поэтому
+        параллельный поиск не видит их наполовину изменёнными."""
+        current = self.load(
+            IngredientRecipe.objects.filter(recipe_id__in=recipe_ids))
+        removed = defaultdict(set)
+        added = defaultdict(set)
+        for recipe_id in recipe_ids:
+            old = set(self.recipes.get(recipe_id, ()))
+            new = current.get(recipe_id, set())
+            for ingredient_id in old - new:
+                removed[ingredient_id].add(recipe_id)
+            for ingredient_id in new - old:
+                added[ingredient_id].add(recipe_id)
+            if new:
+                self.recipes[recipe_id] = array('I', sorted(new))
+            else:
+                self.recipes.pop(recipe_id, None)
+        for ingredient_id in removed.keys() | added.keys():
+            posting = set(self.postings.get(ingredient_id, ()))
+            posting -= removed[ingredient_id]
+            posting |= added[ingredient_id]
+            if posting:
+                self.postings[ingredient_id] = array('I', sorted(posting))
+            else:
+                self.postings.pop(ingredient_id, None)
+
+    def match(self, ingredient_ids):
+        """Пары (id рецепта, доля его ингредиентов из переданных),
+        лучшие совпадения первыми."""
+        self.refresh()
+        counts = Counter()
+        for ingredient_id in set(ingredient_ids):
+            counts.update(self.postings.get(ingredient_id, ()))
+        # update() в другом потоке может удалить рецепт между проверкой и
+        # чтением, поэтому массив берётся одним get().
+        matches = []
+        for recipe_id, count in counts.items():
+            ingredients = self.recipes.get(recipe_id)
+            if ingredients:
+                matches.append(
+                    (recipe_id, count, count / len(ingredients)))
+        matches.sort(key=lambda match: (-match[2], -match[1], -match[0]))
+        return [(recipe_id, coverage) for recipe_id, _, coverage in matches]
+
+
+ingredient_index = IngredientIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -1,3 +1,6 @@
+from copy import deepcopy
+
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_base64.fields import Base64ImageField
@@ -7,10 +10,49 @@ from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
 
+from .rows import image_variant_urls
+
 RECIPES_LIMIT_DEF = 10
 
 
-class UserSerializer(UserSerializer):
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения рецепта.
+
+    Пока копии не готовы или относятся к прежнему изображению,
+    отдаётся пустой словарь и клиент использует поле image.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return image_variant_urls(
+            recipe.image_variants, recipe.image.name,
+            self.context.get('request'))
+
+
+class SparseFieldsSerializerMixin:
+    """Оставляет в ответе только поля fields.
+
+    Вложенные объекты из Meta.collapsed_fields, которых нет в expand,
+    заменяются полями с идентификаторами. По умолчанию выводятся все поля
+    и все вложенные объекты развёрнуты.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand is not None:
+            collapsed = getattr(self.Meta, 'collapsed_fields', {})
+            for name, field in collapsed.items():
+                if name in self.fields and name not in expand:
+                    self.fields[name] = deepcopy(field)
+
+
+class UserSerializer(SparseFieldsSerializerMixin, UserSerializer):
     is_subscribed = SerializerMethodField(read_only=True)
 
     class Meta:
@@ -19,8 +61,12 @@ class UserSerializer(UserSerializer):
                   'last_name', 'is_subscribed', )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return obj.following.filter(user=request.user.id).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        user = self.context.get('request').user
+        if not user.is_authenticated:
+            return False
+        return obj.following.filter(user=user).exists()
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -32,10 +78,11 @@ class UserCreateSerializer(UserCreateSerializer):
 
 
 class SubscribeRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscribeSerializer(UserSerializer):
@@ -45,6 +92,9 @@ class SubscribeSerializer(UserSerializer):
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes_count', 'recipes')
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
+        collapsed_fields = {
+            'recipes': SerializerMethodField(method_name='get_recipe_ids'),
+        }
 
     def validate(self, data):
         author_id = self.context.get(
@@ -64,21 +114,28 @@ class SubscribeSerializer(UserSerializer):
         return data
 
     def get_recipes_count(self, obj):
-        return obj.recipe_set.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = int(request.GET.get('recipes_limit', RECIPES_LIMIT_DEF))
-        recipes = Recipe.objects.filter(author=obj)[:limit]
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            request = self.context.get('request')
+            limit = int(request.GET.get('recipes_limit', RECIPES_LIMIT_DEF))
+            recipes = Recipe.objects.filter(author=obj)[:limit]
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
+    def get_recipe_ids(self, obj):
+        return [recipe.id for recipe in obj.recipes_preview]
+
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -96,9 +153,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit'
@@ -109,7 +164,8 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsSerializerMixin,
+                           serializers.ModelSerializer):
     tags = TagSerializer(read_only=False, many=True)
     author = UserSerializer(read_only=True, many=False)
     ingredients = IngredientRecipeSerializer(
@@ -119,39 +175,61 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(max_length=None)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+        collapsed_fields = {
+            'author': serializers.PrimaryKeyRelatedField(read_only=True),
+            'tags': serializers.PrimaryKeyRelatedField(
+                many=True, read_only=True),
+            'ingredients': serializers.SlugRelatedField(
+                source='ingredienttorecipe', slug_field='ingredient_id',
+                many=True, read_only=True),
+        }
 
     def get_ingredients(self, obj):
         ingredients = IngredientRecipe.objects.filter(recipe=obj)
         return IngredientRecipeSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get("request")
         if request.user.is_authenticated:
             return obj.favorites.filter(user=request.user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         if request.user.is_authenticated:
             return obj.shopping_list.filter(user=request.user).exists()
         return False
 
 
+class RecipeCoverageSerializer(RecipeReadSerializer):
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('coverage',)
+
+
+class AvailableIngredientsSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False)
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     ingredients = IngredientRecipeSerializer(
         many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField(max_length=None)
     cooking_time = serializers.IntegerField()
 
@@ -162,11 +240,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'name', 'image', 'text', 'cooking_time',)
 
     def validate_tags(self, tags):
-        for tag in tags:
-            if not Tag.objects.filter(id=tag.id).exists():
-                raise serializers.ValidationError(
-                    'Указанного тега не существует')
-        return tags
+        found = Tag.objects.in_bulk(tags)
+        if len(found) != len(set(tags)):
+            raise serializers.ValidationError(
+                'Указанного тега не существует')
+        return list(found.values())
 
     def validate_cooking_time(self, cooking_time):
         if cooking_time < 1:
@@ -175,15 +253,19 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return cooking_time
 
     def validate_ingredients(self, ingredients):
-        ingredients_list = []
+        ingredient_ids = set()
         for ingredient in ingredients:
-            if ingredient['id'] in ingredients_list:
+            if ingredient['ingredient_id'] in ingredient_ids:
                 raise serializers.ValidationError(
                     'Ингридиенты должны быть уникальны')
-            ingredients_list.append(ingredient['id'])
+            ingredient_ids.add(ingredient['ingredient_id'])
             if int(ingredient.get('amount')) < 1:
                 raise serializers.ValidationError(
                     'Количество ингредиента не меньше 1')
+        if len(Ingredient.objects.in_bulk(ingredient_ids)) != len(
+                ingredient_ids):
+            raise serializers.ValidationError(
+                'Указанного ингредиента не существует')
         return ingredients
 
     @staticmethod
@@ -192,13 +274,40 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         for ingredient_data in ingredients:
             ingredient_list.append(
                 IngredientRecipe(
-                    ingredient=ingredient_data.pop('id'),
+                    ingredient_id=ingredient_data.pop('ingredient_id'),
                     amount=ingredient_data.pop('amount'),
                     recipe=recipe,
                 )
             )
         IngredientRecipe.objects.bulk_create(ingredient_list)
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        amounts = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            row.ingredient_id: row
+            for row in recipe.ingredienttorecipe.all()
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        RecipeCreateSerializer.create_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient_id'] not in current
+        ])
+
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request', None)
         tags = validated_data.pop('tags')
@@ -208,17 +317,21 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        instance.tags.set(validated_data.pop('tags'))
-        ingredients = validated_data.pop('ingredients')
-        self.create_ingredients(instance, ingredients)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        ingredients = validated_data.pop('ingredients', None)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.for_read(request.user).get(pk=instance.pk)
         return RecipeReadSerializer(instance, context={
-            'request': self.context.get('request')
+            'request': request
         }).data
 
 
@@ -0,0 +1,104 @@
+import csv
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from fpdf import FPDF
+from recipes.cache import shopping_cart_version
+from recipes.models import IngredientRecipe
+
+TITLE = 'Купить в магазине:'
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+CHUNK_SIZE = 2000
+CACHE_KEY = 'shopping_cart:{user_id}:{version}'
+CACHE_TIMEOUT = 60 * 60 * 24
+DEFAULT_FORMAT = 'txt'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: отдаёт строку вместо записи в файл."""
+
+    def write(self, value):
+        return value
+
+
+def get_file_format(request):
+    return request.query_params.get('file_format', DEFAULT_FORMAT)
+
+
+def get_etag(request, *args, **kwargs):
+    user_id = request.user.id
+    version = shopping_cart_version(user_id)
+    return f'{user_id}-{version}-{get_file_format(request)}'
+
+
+def get_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(
+        shopping_cart_version(request.user.id), tz=timezone.utc)
+
+
+def get_ingredients(user):
+    """Суммы ингредиентов из корзины пользователя.
+
+    Строки берутся из кэша текущей версии корзины, а при промахе
+    читаются курсором и кладутся в кэш после полной выдачи.
+    """
+    key = CACHE_KEY.format(
+        user_id=user.id, version=shopping_cart_version(user.id))
+    ingredients = cache.get(key)
+    if ingredients is not None:
+        yield from ingredients
+        return
+    ingredients = []
+    for ingredient in IngredientRecipe.objects.filter(
+        recipe__shopping_list__user=user
+    ).order_by('ingredient__name').values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(amount=Sum('amount')).iterator(chunk_size=CHUNK_SIZE):
+        ingredients.append(ingredient)
+        yield ingredient
+    cache.set(key, ingredients, CACHE_TIMEOUT)
+
+
+def ingredient_line(ingredient):
+    return (f"{ingredient['ingredient__name']}"
+            f"({ingredient['ingredient__measurement_unit']}) - "
+            f"{ingredient['amount']}")
+
+
+def render_txt(ingredients):
+    yield TITLE
+    for ingredient in ingredients:
+        yield f'\n{ingredient_line(ingredient)}'
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def render_pdf(ingredients):
+    """PDF собирается целиком: формат не допускает потоковой записи."""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.add_font('DejaVu', '', settings.SHOPPING_LIST_FONT, uni=True)
+    pdf.set_font('DejaVu', size=14)
+    pdf.cell(0, 10, TITLE, ln=1)
+    pdf.set_font_size(12)
+    for ingredient in ingredients:
+        pdf.cell(0, 8, ingredient_line(ingredient), ln=1)
+    yield pdf.output(dest='S').encode('latin-1')
+
+
+FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
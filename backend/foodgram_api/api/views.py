@@ -1,30 +1,68 @@
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from django.conf import settings
+from django.db.models import BooleanField, Value
+from django.http import Http404, HttpResponse
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag, User)
+from recipes.cache import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY
+from recipes.models import (Favorite, Follow, Ingredient, Recipe, ShoppingCart,
+                            Tag, User)
+from recipes.recommendations import recommended_recipes
 from rest_framework import status, viewsets
-from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
-from .filters import RecipeFilter
-from .pagination import Pagination
+from . import shopping_list
+from .filters import IngredientSearchFilter, RecipeFilter
+from .fragments import serialize_recipes
+from .metrics import CONTENT_TYPE, registry
+from .mixins import (CachedCatalogueMixin, KeysetPaginationMixin,
+                     SparseFieldsMixin)
+from .pagination import FeedPagination, Pagination
 from .permissions import IsAdminAuthorOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeReadSerializer,
-                          ShoppingCartSerializer, SubscribeSerializer,
-                          TagSerializer, UserSerializer)
+from .rows import subscription_rows
+from .search import recipe_ingredient_index
+from .serializers import (RECIPES_LIMIT_DEF, AvailableIngredientsSerializer,
+                          FavoriteSerializer, IngredientSerializer,
+                          RecipeCoverageSerializer, RecipeCreateSerializer,
+                          RecipeReadSerializer, ShoppingCartSerializer,
+                          SubscribeSerializer, TagSerializer, UserSerializer)
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(SparseFieldsMixin, KeysetPaginationMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = Pagination
+    keyset_ordering = ('id', )
+    sparse_actions = ('list', 'retrieve', 'me', 'subscriptions')
+
+    def get_queryset(self):
+        """Флаг подписки считается в запросе списка одним Exists(); для
+        анонимов он всегда False и не вычисляется."""
+        queryset = super().get_queryset()
+        user = self.request.user
+        if (self.action not in ('list', 'retrieve')
+                or not user.is_authenticated):
+            return queryset
+        sparse = self.get_sparse_fields()
+        if sparse is None or 'is_subscribed' in sparse[0]:
+            return queryset.with_is_subscribed(user)
+        return queryset
+
+    def get_instance(self):
+        """Подписаться на самого себя нельзя (см.
+        SubscribeSerializer.validate), флаг для /users/me/ известен без
+        запроса."""
+        user = self.request.user
+        user.is_subscribed = False
+        return user
 
     @action(
         detail=True,
@@ -50,37 +88,80 @@ class UserViewSet(UserViewSet):
         permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        following = User.objects.filter(following__user=user)
-        pages = self.paginate_queryset(following)
+        limit = int(request.GET.get('recipes_limit', RECIPES_LIMIT_DEF))
+        following = User.objects.filter(following__user=user).order_by('id')
+        sparse = self.get_sparse_fields(SubscribeSerializer)
+        if sparse is None and settings.FAST_JSON:
+            pages = self.paginate_queryset(following)
+            return self.get_paginated_response(
+                subscription_rows(pages, limit))
+        fields, expand = sparse or (None, None)
+        if fields is None or 'recipes' in fields:
+            following = following.with_recipes_preview(limit)
+        pages = self.paginate_queryset(following.annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ))
         serializer = SubscribeSerializer(
-            pages, many=True, context={'request': request}
+            pages, many=True, context={'request': request},
+            fields=fields, expand=expand,
         )
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CachedCatalogueMixin, viewsets.ModelViewSet):
+    catalogue_version_key = INGREDIENTS_VERSION_KEY
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, )
-    filter_backends = (SearchFilter, )
-    search_fields = ('^name', )
+    filter_backends = (IngredientSearchFilter, )
     pagination_class = None
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CachedCatalogueMixin, viewsets.ModelViewSet):
+    catalogue_version_key = TAGS_VERSION_KEY
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SparseFieldsMixin, KeysetPaginationMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
     permission_classes = (IsAdminAuthorOrReadOnly, )
     pagination_class = Pagination
+    keyset_ordering = ('-pub_date', '-id')
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    sparse_actions = ('list', 'retrieve', 'feed', 'recommended')
+
+    def get_queryset(self):
+        if self.action in self.sparse_actions:
+            sparse = self.get_sparse_fields()
+            if sparse is not None:
+                return Recipe.objects.for_fields(self.request.user, *sparse)
+            return Recipe.objects.with_user_flags(self.request.user)
+        return super().get_queryset()
+
+    def get_recipes_data(self, recipes):
+        """Полные карточки собираются из кэша, а ответ с fields, omit или
+        expand сериализуется только с нужными полями."""
+        if self.get_sparse_fields() is None:
+            return serialize_recipes(recipes, self.request)
+        return self.get_serializer(recipes, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(self.get_recipes_data(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_recipes_data([self.get_object()])[0])
+
+    def get_keyset_ordering(self):
+        return RecipeFilter.ORDERINGS.get(
+            self.request.GET.get('ordering'), self.keyset_ordering)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -88,26 +169,68 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeCreateSerializer
 
     @staticmethod
-    def send_message(ingredients):
-        shopping_list = 'Купить в магазине:'
-        for ingredient in ingredients:
-            shopping_list += (
-                f"\n{ingredient['ingredient__name']}"
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['amount']}")
-        file = 'shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="{file}.txt"'
+    def send_message(ingredients, file_format):
+        render, content_type = shopping_list.FORMATS[file_format]
+        file = f'shopping_list.{file_format}'
+        response = StreamingHttpResponse(
+            render(ingredients), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{file}"'
+        patch_cache_control(response, private=True, no_cache=True)
         return response
 
-    @action(detail=False, methods=['GET'])
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[IsAuthenticated])
+    @method_decorator(condition(
+        etag_func=shopping_list.get_etag,
+        last_modified_func=shopping_list.get_last_modified,
+    ))
     def download_shopping_cart(self, request):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_list__user=request.user
-        ).order_by('ingredient__name').values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        return self.send_message(ingredients)
+        file_format = shopping_list.get_file_format(request)
+        if file_format not in shopping_list.FORMATS:
+            raise ValidationError({'file_format': (
+                'Доступные форматы: '
+                f'{", ".join(shopping_list.FORMATS)}'
+            )})
+        ingredients = shopping_list.get_ingredients(request.user)
+        return self.send_message(ingredients, file_format)
+
+    @action(detail=False, methods=('POST',))
+    def what_can_i_cook(self, request):
+        """Рецепты по доле ингредиентов, которые есть у пользователя."""
+        serializer = AvailableIngredientsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        matches = recipe_ingredient_index.match(
+            serializer.validated_data['ingredients'])
+        paginator = Pagination()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        recipes = Recipe.objects.for_read(request.user).in_bulk(
+            [recipe_id for recipe_id, _ in page])
+        found = []
+        for recipe_id, coverage in page:
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.coverage = coverage
+                found.append(recipe)
+        serializer = RecipeCoverageSerializer(
+            found, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые первыми."""
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            self.get_queryset(), request, view=self)
+        return paginator.get_paginated_response(self.get_recipes_data(page))
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def recommended(self, request):
+        recipes = recommended_recipes(self.get_queryset(), request.user)
+        paginator = Pagination()
+        page = paginator.paginate_queryset(recipes, request, view=self)
+        return paginator.get_paginated_response(self.get_recipes_data(page))
 
     @action(
         detail=True,
@@ -158,3 +281,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
             recipe=get_object_or_404(Recipe, id=pk)
         ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Метрики по маршрутам доступны только администраторам: Prometheus
+    передаёт токен администратора в заголовке Authorization."""
+    if not settings.REQUEST_METRICS:
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
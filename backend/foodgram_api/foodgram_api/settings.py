@@ -58,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.metrics.QueryMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_api.urls'
@@ -97,6 +98,18 @@ DATABASES = {
     }
 }
 
+# Версии справочников, рецептов и списков покупок хранятся в кэше и
+# должны быть общими для всех процессов gunicorn, поэтому по умолчанию
+# используется Redis. LocMemCache годится только для одного процесса
+# (проверка recipes.W001 предупреждает об этом).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/0'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -142,9 +155,39 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Потоки для фоновых задач (копии изображений, дополнение лент); 0 -
+# выполнять сразу после фиксации транзакции. IMAGE_WORKERS - прежнее имя.
+BACKGROUND_WORKERS = int(
+    os.getenv('BACKGROUND_WORKERS', os.getenv('IMAGE_WORKERS', 2)))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+# Поиск ингредиентов по индексу в памяти процесса; при False запросы идут
+# в базу (на PostgreSQL их обслуживает триграммный индекс).
+INGREDIENT_INDEX = os.getenv('INGREDIENT_INDEX', 'True') == 'True'
+
+# Метрики запросов к api: /api/metrics/ (только администраторам) и журнал
+# медленных запросов.
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', 'False') == 'True'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+
+# Быстрый путь чтения: ответы собираются из .values() и рендерятся orjson.
+FAST_JSON = os.getenv('FAST_JSON', 'True') == 'True'
+
+# Кэш токенов аутентификации: LRU в памяти процесса и общий кэш (с
+# LocMemCache не используется). Отозванный токен другие процессы
+# принимают ещё до AUTH_TOKEN_LOCAL_TIMEOUT секунд.
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 300))
+AUTH_TOKEN_LOCAL_TIMEOUT = int(os.getenv('AUTH_TOKEN_LOCAL_TIMEOUT', 10))
+AUTH_TOKEN_LOCAL_SIZE = int(os.getenv('AUTH_TOKEN_LOCAL_SIZE', 10000))
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -157,6 +200,18 @@ REST_FRAMEWORK = {
     ]
 }
 
+REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+    'api.renderers.ORJSONRenderer' if FAST_JSON
+    else 'api.renderers.JSONRenderer',
+    'rest_framework.renderers.BrowsableAPIRenderer',
+)
+if FAST_JSON:
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = (
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    )
+
 DJOSER = {
     "LOGIN_FIELD": 'email',
     "SERIALIZERS": {
@@ -8,7 +8,8 @@ from .models import (Favorite, Follow, Ingredient, Recipe, ShoppingCart, Tag,
 class UserAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'username', 'email',
-        'first_name', 'last_name', 'date_joined',)
+        'first_name', 'last_name', 'date_joined',
+        'recipes_count', 'followers_count',)
 
 
 @admin.register(Follow)
@@ -19,7 +20,8 @@ class FollowAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('author', 'name', 'cooking_time',
-                    'text', 'pub_date', )
+                    'text', 'pub_date', 'favorites_count',
+                    'in_carts_count', )
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,221 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+SHOPPING_CART_VERSION_KEY = 'shopping_cart:version:{user_id}'
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+TAGS_VERSION_KEY = 'tags:version'
+RECIPE_VERSION_KEY = 'recipe:version:{recipe_id}'
+RECIPE_CHANGES_SEQ_KEY = 'recipes:changes:seq'
+RECIPE_CHANGES_EPOCH_KEY = 'recipes:changes:epoch'
+RECIPE_CHANGE_KEY = 'recipes:changes:{epoch}:{seq}'
+RECIPE_CHANGE_TIMEOUT = 24 * 60 * 60
+AUTH_TOKEN_KEY = 'auth:token:{digest}'
+
+
+def get_or_add(key, default):
+    """Значение ключа; отсутствующий ключ создаётся со значением default.
+
+    add() не перезаписывает значение, которое успел записать другой
+    процесс, поэтому после него ключ читается заново.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    cache.add(key, default, timeout=None)
+    return cache.get(key)
+
+
+def is_shared():
+    """Видят ли другие процессы записи кэша по умолчанию."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def get_version(key):
+    """Версия данных: время последнего изменения (timestamp)."""
+    return get_or_add(key, time.time())
+
+
+def get_versions(keys):
+    """Версии для нескольких ключей за одно обращение к кэшу."""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def bump_versions(keys):
+    """Меняет версии после фиксации транзакции, чтобы не кэшировать
+    данные, которые ещё не видны другим соединениям."""
+    keys = list(keys)
+    transaction.on_commit(lambda: cache.set_many(
+        {key: time.time() for key in keys}, timeout=None))
+
+
+def shopping_cart_version(user_id):
+    return get_version(SHOPPING_CART_VERSION_KEY.format(user_id=user_id))
+
+
+def touch_shopping_carts(user_ids):
+    """Сбрасывает закэшированные списки покупок пользователей."""
+    bump_versions(
+        SHOPPING_CART_VERSION_KEY.format(user_id=user_id)
+        for user_id in set(user_ids)
+    )
+
+
+def recipe_version_keys(recipe_ids):
+    return {
+        recipe_id: RECIPE_VERSION_KEY.format(recipe_id=recipe_id)
+        for recipe_id in recipe_ids
+    }
+
+
+def touch_recipes(recipe_ids):
+    """Сбрасывает закэшированные карточки рецептов."""
+    bump_versions(recipe_version_keys(set(recipe_ids)).values())
+
+
+def touch_ingredients():
+    bump_versions([INGREDIENTS_VERSION_KEY])
+
+
+def touch_tags():
+    bump_versions([TAGS_VERSION_KEY])
+
+
+def get_recipe_changes_seq():
+    """Эпоха журнала изменённых рецептов и номер последней записи в нём.
+
+    Счётчик, вытесненный из кэша, начинается заново с нуля в новой эпохе:
+    процесс, создавший его, меняет эпоху, и индексы, построенные по
+    прежней, перестраиваются целиком. Номера записей растут через
+    cache.incr, атомарный в Redis и memcached.
+    """
+    if cache.get(RECIPE_CHANGES_SEQ_KEY) is None and cache.add(
+            RECIPE_CHANGES_SEQ_KEY, 0, timeout=None):
+        cache.set(RECIPE_CHANGES_EPOCH_KEY, uuid4().hex, timeout=None)
+    epoch = get_or_add(RECIPE_CHANGES_EPOCH_KEY, uuid4().hex)
+    return epoch, get_or_add(RECIPE_CHANGES_SEQ_KEY, 0)
+
+
+def log_recipe_changes(recipe_ids):
+    """Записывает изменённые рецепты в журнал, по которому индексы в
+    памяти процессов обновляются без полной перестройки."""
+    recipe_ids = list(recipe_ids)
+
+    def log():
+        epoch, _ = get_recipe_changes_seq()
+        for recipe_id in recipe_ids:
+            try:
+                seq = cache.incr(RECIPE_CHANGES_SEQ_KEY)
+            except ValueError:
+                # Счётчик вытеснен: следующее чтение начнёт новую эпоху.
+                return
+            cache.set(RECIPE_CHANGE_KEY.format(epoch=epoch, seq=seq),
+                      recipe_id, timeout=RECIPE_CHANGE_TIMEOUT)
+
+    transaction.on_commit(log)
+
+
+def get_recipe_changes(epoch, start, end):
+    """id рецептов из записей журнала эпохи epoch с start + 1 по end.
+
+    None, если часть записей уже вытеснена из кэша.
+    """
+    keys = [
+        RECIPE_CHANGE_KEY.format(epoch=epoch, seq=seq)
+        for seq in range(start + 1, end + 1)
+    ]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        return None
+    return set(changes.values())
+
+
+def token_digest(key):
+    """Ключи кэша строятся по хэшу, а не по самому токену."""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenCache:
+    """Токены аутентификации вместе с пользователями.
+
+    Токен хранится в LRU в памяти процесса и в общем кэше. Сброс удаляет
+    запись из общего кэша и из LRU текущего процесса; в LRU других
+    процессов она живёт до AUTH_TOKEN_LOCAL_TIMEOUT секунд, поэтому выход
+    из системы или смена пароля видны им с этой задержкой.
+
+    Если CACHES - LocMemCache, «общий» кэш у каждого процесса свой и сброс
+    в него из другого процесса не попадает. Тогда этот уровень не
+    используется, и задержка всё равно не больше AUTH_TOKEN_LOCAL_TIMEOUT.
+
+    Локально хранится pickle, чтобы одновременные запросы не делили один
+    экземпляр пользователя.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+
+    def get(self, digest):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.local.get(digest)
+            if entry is not None and entry[0] <= now:
+                del self.local[digest]
+                entry = None
+            if entry is not None:
+                self.local.move_to_end(digest)
+                return pickle.loads(entry[1])
+        if not is_shared():
+            return None
+        token = cache.get(AUTH_TOKEN_KEY.format(digest=digest))
+        if token is not None:
+            self.remember(digest, token)
+        return token
+
+    def set(self, digest, token):
+        if is_shared():
+            cache.set(AUTH_TOKEN_KEY.format(digest=digest), token,
+                      timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        self.remember(digest, token)
+
+    def remember(self, digest, token):
+        expires = time.monotonic() + settings.AUTH_TOKEN_LOCAL_TIMEOUT
+        with self.lock:
+            self.local[digest] = (expires, pickle.dumps(token))
+            self.local.move_to_end(digest)
+            while len(self.local) > settings.AUTH_TOKEN_LOCAL_SIZE:
+                self.local.popitem(last=False)
+
+    def invalidate(self, digests):
+        """Удаляет токены после фиксации транзакции, иначе параллельный
+        запрос может снова закэшировать прежние данные."""
+        digests = list(digests)
+
+        def invalidate():
+            with self.lock:
+                for digest in digests:
+                    self.local.pop(digest, None)
+            if is_shared():
+                cache.delete_many([
+                    AUTH_TOKEN_KEY.format(digest=digest)
+                    for digest in digests
+                ])
+
+        transaction.on_commit(invalidate)
+
+
+token_cache = TokenCache()
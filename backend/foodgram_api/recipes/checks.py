@@ -0,0 +1,18 @@
+from django.core.checks import Tags, Warning, register
+
+from .cache import is_shared
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии кэшированных данных меняются только в общем кэше: с
+    LocMemCache другие процессы продолжают отдавать устаревшие данные."""
+    if is_shared():
+        return []
+    return [Warning(
+        'Кэш по умолчанию хранится в памяти процесса: изменения рецептов, '
+        'справочников и списков покупок не видны другим процессам.',
+        hint='Укажите общий кэш в CACHE_BACKEND и CACHE_LOCATION '
+             '(Redis или memcached), если процессов больше одного.',
+        id='recipes.W001',
+    )]
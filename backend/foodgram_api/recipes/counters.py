@@ -0,0 +1,30 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся на внешний объект."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field).annotate(count=Count('pk')).values('count'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def recount(user_model, recipe_model, favorite_model, shopping_cart_model,
+            follow_model):
+    """Пересчитывает счётчики одним UPDATE на таблицу.
+
+    Модели передаются явно, чтобы функцию можно было вызвать из миграции.
+    """
+    recipe_model.objects.update(
+        favorites_count=count_of(favorite_model, 'recipe'),
+        in_carts_count=count_of(shopping_cart_model, 'recipe'),
+    )
+    user_model.objects.update(
+        recipes_count=count_of(recipe_model, 'author'),
+        followers_count=count_of(follow_model, 'author'),
+    )
@@ -0,0 +1,120 @@
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+
+from . import tasks
+from .models import FeedItem, Follow, Recipe, User
+
+BATCH_SIZE = 1000
+
+
+def add_to_feeds(user_ids, recipes):
+    """Добавляет рецепты (пары id, pub_date) в ленты пользователей."""
+    recipes = list(recipes)
+    batch = []
+    for user_id in user_ids:
+        batch.extend(
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        )
+        if len(batch) >= BATCH_SIZE:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fans_out(author_id):
+    """Рецепты автора раскладываются по лентам, пока у него не больше
+    FEED_FANOUT_LIMIT подписчиков."""
+    return User.objects.filter(
+        pk=author_id, followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def followers(author_id):
+    return Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True).iterator(chunk_size=BATCH_SIZE)
+
+
+def publish(recipe):
+    if fans_out(recipe.author_id):
+        add_to_feeds(
+            followers(recipe.author_id), [(recipe.pk, recipe.pub_date)])
+
+
+def author_recipes(author_id):
+    return list(Recipe.objects.filter(
+        author_id=author_id).values_list('pk', 'pub_date'))
+
+
+def backfill_follower(user_id, author_id):
+    """Рецепты автора в ленту нового подписчика, если подписка ещё есть."""
+    if fans_out(author_id) and Follow.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).exists():
+        add_to_feeds([user_id], author_recipes(author_id))
+
+
+def backfill_followers(author_id):
+    """Рецепты автора в ленты всех подписчиков. Повторный запуск ничего
+    не дублирует, а если автор снова превысил порог, лента собирается
+    при чтении."""
+    if fans_out(author_id):
+        add_to_feeds(followers(author_id), author_recipes(author_id))
+
+
+def follow(user_id, author_id):
+    """Дополнение ленты ставится в фоновый пул, чтобы не задерживать
+    запрос на подписку."""
+    tasks.schedule(backfill_follower, user_id, author_id)
+
+
+def unfollow(user_id, author_id):
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+    if User.objects.filter(
+        pk=author_id, followers_count=settings.FEED_FANOUT_LIMIT
+    ).exists():
+        # Автор опустился до порога: рецептов, опубликованных выше
+        # порога, в лентах нет.
+        tasks.schedule(backfill_followers, author_id)
+
+
+def before(position, date_field, id_field):
+    """Условие «строго после позиции» для порядка (-pub_date, -id)."""
+    pub_date, recipe_id = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(**{
+        date_field: pub_date, f'{id_field}__lt': recipe_id})
+
+
+def feed_recipe_ids(user, limit, position=None):
+    """Первые limit рецептов ленты после position, новые первыми.
+
+    Записи FeedItem читаются по индексу ленты пользователя, рецепты
+    популярных авторов из подписок - отдельным запросом по индексу
+    (author, -pub_date, -id); оба упорядоченных потока сливаются здесь.
+    Рецепты, уже попавшие в FeedItem (автор превысил порог позже),
+    второй поток пропускает.
+    """
+    items = FeedItem.objects.filter(user=user)
+    popular = Recipe.objects.filter(
+        author__in=Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values('author')
+    ).exclude(Exists(
+        FeedItem.objects.filter(user=user, recipe=OuterRef('pk'))))
+    if position is not None:
+        items = items.filter(before(position, 'pub_date', 'recipe_id'))
+        popular = popular.filter(before(position, 'pub_date', 'id'))
+    return [
+        recipe_id for _, recipe_id in islice(merge(
+            items.order_by('-pub_date', '-recipe').values_list(
+                'pub_date', 'recipe_id')[:limit],
+            popular.order_by('-pub_date', '-id').values_list(
+                'pub_date', 'id')[:limit],
+            reverse=True,
+        ), limit)
+    ]
@@ -0,0 +1,132 @@
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import F, OuterRef, Subquery
+
+CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+GIN_INDEX = 'recipes_recipe_search_vector_gin'
+# Веса bm25 для колонок name, text, ingredients таблицы FTS5.
+FTS_WEIGHTS = '10.0, 1.0, 5.0'
+TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(value):
+    """FTS5 не считает «ё» буквой «е» с диакритикой."""
+    return value.lower().replace('ё', 'е')
+
+
+def get_vendor(queryset):
+    return connections[queryset.db].vendor
+
+
+def create_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {GIN_INDEX} '
+            'ON recipes_recipe USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            'name, text, ingredients, '
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def update_search_index(recipes):
+    """Переиндексирует рецепты из queryset: название, описание и
+    названия ингредиентов."""
+    ingredient_recipe = recipes.model._meta.get_field(
+        'ingredienttorecipe').related_model
+    vendor = get_vendor(recipes)
+    if vendor == 'postgresql':
+        # Агрегаты contrib.postgres требуют psycopg, которого может не
+        # быть в окружении с SQLite.
+        from django.contrib.postgres.aggregates import StringAgg
+
+        names = Subquery(
+            ingredient_recipe.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names')
+        )
+        recipes.update(search_vector=(
+            SearchVector('name', weight='A', config=CONFIG)
+            + SearchVector(names, weight='B', config=CONFIG)
+            + SearchVector('text', weight='C', config=CONFIG)
+        ))
+    elif vendor == 'sqlite':
+        rows = list(recipes.values_list('pk', 'name', 'text'))
+        names = defaultdict(list)
+        for recipe_id, name in ingredient_recipe.objects.filter(
+            recipe__in=[row[0] for row in rows]
+        ).values_list('recipe_id', 'ingredient__name'):
+            names[recipe_id].append(name)
+        with connections[recipes.db].cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(row[0],) for row in rows],
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+                'VALUES (%s, %s, %s, %s)',
+                [
+                    (pk, normalize(name), normalize(text),
+                     normalize(' '.join(names[pk])))
+                    for pk, name, text in rows
+                ],
+            )
+
+
+def remove_from_search_index(recipe):
+    connection = connections[recipe._state.db or 'default']
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (recipe.pk,))
+
+
+def search(queryset, query):
+    """Фильтрует рецепты по запросу и сортирует по релевантности."""
+    vendor = get_vendor(queryset)
+    if vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-id')
+    if vendor == 'sqlite':
+        tokens = TOKEN_RE.findall(normalize(query))
+        if not tokens:
+            return queryset.none()
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        # Таблица FTS5 присоединяется к рецептам: MATCH выполняется один
+        # раз, а bm25 доступен для каждой найденной строки.
+        table = queryset.model._meta.db_table
+        column = queryset.model._meta.pk.column
+        return queryset.extra(
+            select={
+                'search_rank': f'-bm25({FTS_TABLE}, {FTS_WEIGHTS})',
+            },
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = {table}.{column}',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+        ).order_by('-search_rank', '-id')
+    return queryset.filter(name__icontains=query)
@@ -0,0 +1,56 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from . import tasks
+from .cache import touch_recipes
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'small': (320, 320),
+    'medium': (800, 800),
+}
+VARIANTS_DIR = 'recipes/image/variants'
+WEBP_QUALITY = 80
+
+
+def make_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail(size)
+    if variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA')
+    buffer = BytesIO()
+    variant.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_variants(recipe_id, name):
+    """Сохраняет уменьшенные WebP-копии изображения рецепта."""
+    from .models import Recipe
+
+    try:
+        storage = Recipe._meta.get_field('image').storage
+        with storage.open(name) as file:
+            image = Image.open(file)
+            image.load()
+        stem = os.path.splitext(os.path.basename(name))[0]
+        variants = {'source': name}
+        for variant, size in VARIANTS.items():
+            variants[variant] = storage.save(
+                f'{VARIANTS_DIR}/{stem}_{variant}.webp',
+                make_variant(image, size),
+            )
+        if Recipe.objects.filter(pk=recipe_id, image=name).update(
+                image_variants=variants):
+            touch_recipes([recipe_id])
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def schedule_variants(recipe):
+    """Ставит обработку изображения в пул после фиксации транзакции."""
+    tasks.schedule(generate_variants, recipe.pk, recipe.image.name)
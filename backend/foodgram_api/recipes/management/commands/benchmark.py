@@ -0,0 +1,204 @@
+import base64
+import statistics
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from recipes.models import Follow, Ingredient, Recipe, Tag, User
+from recipes.seeding import seed, temporary_database
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+# Название, метод, путь, тело запроса, анонимный ли запрос и верхняя
+# граница числа SQL-запросов. В путях и телах подставляются значения из
+# контекста, см. Command.get_context(). Границы для карточек рецептов
+# учитывают промах кэша карточек (четыре запроса на сериализацию), токен
+# после прогрева берётся из кэша и запросов не требует.
+ENDPOINTS = (
+    ('recipes list', 'get', '/api/recipes/', None, False, 7),
+    ('recipes list anonymous', 'get', '/api/recipes/', None, True, 6),
+    ('recipes list by tags', 'get', '/api/recipes/?tags={tag}', None,
+     False, 7),
+    ('recipes list cursor', 'get', '/api/recipes/?cursor=', None, False, 6),
+    ('recipes list sparse', 'get',
+     '/api/recipes/?fields=id,name,image,cooking_time', None, False, 2),
+    ('recipes search', 'get', '/api/recipes/?search=суп', None, False, 8),
+    ('recipe detail', 'get', '/api/recipes/{recipe}/', None, False, 6),
+    ('recipe create', 'post', '/api/recipes/', 'recipe_body', False, 21),
+    ('recipe update', 'patch', '/api/recipes/{own_recipe}/', 'update_body',
+     False, 19),
+    ('recipes feed', 'get', '/api/recipes/feed/', None, False, 6),
+    ('recipes feed sparse', 'get',
+     '/api/recipes/feed/?fields=id,name,image,author&expand=', None,
+     False, 3),
+    ('recipes recommended', 'get', '/api/recipes/recommended/', None,
+     False, 7),
+    ('what can i cook', 'post', '/api/recipes/what_can_i_cook/',
+     'cook_body', False, 5),
+    ('favorite add', 'post', '/api/recipes/{other_recipe}/favorite/', None,
+     False, 6),
+    ('favorite remove', 'delete', '/api/recipes/{other_recipe}/favorite/',
+     None, False, 6),
+    ('shopping cart add', 'post',
+     '/api/recipes/{other_recipe}/shopping_cart/', None, False, 6),
+    ('shopping cart remove', 'delete',
+     '/api/recipes/{other_recipe}/shopping_cart/', None, False, 6),
+    ('download shopping cart', 'get',
+     '/api/recipes/download_shopping_cart/', None, False, 3),
+    ('subscriptions', 'get', '/api/users/subscriptions/', None, False, 3),
+    ('subscribe', 'post', '/api/users/{other_author}/subscribe/', None,
+     False, 13),
+    ('unsubscribe', 'delete', '/api/users/{other_author}/subscribe/', None,
+     False, 8),
+    ('users list', 'get', '/api/users/', None, False, 3),
+    ('users me', 'get', '/api/users/me/', None, False, 1),
+    ('ingredients search', 'get', '/api/ingredients/?name=суп', None,
+     False, 0),
+    ('tags list', 'get', '/api/tags/', None, False, 0),
+)
+
+
+def png():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), 'orange').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+class Command(BaseCommand):
+    help = ('Замерить число SQL-запросов и время ответа эндпоинтов api на '
+            'сгенерированных данных во временной тестовой базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--favorites', type=int, default=20000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз выполнить каждый запрос.',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=1,
+            help='Сколько первых прогонов не учитывать (прогрев кэшей).',
+        )
+
+    def handle(self, *args, **options):
+        # Замеряется установившийся режим: токен не должен выпадать из
+        # локального кэша посреди прогонов.
+        with temporary_database(), override_settings(
+                AUTH_TOKEN_LOCAL_TIMEOUT=24 * 60 * 60):
+            failures = self.benchmark(options)
+        if failures:
+            raise CommandError(
+                'Превышено число SQL-запросов или ошибка ответа: '
+                + ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Все эндпоинты в пределах.'))
+
+    def benchmark(self, options):
+        started = time.monotonic()
+        seed(users=options['users'], ingredients=options['ingredients'],
+             recipes=options['recipes'], favorites=options['favorites'],
+             carts=options['carts'], follows=options['follows'],
+             random_seed=options['seed'])
+        self.stdout.write(
+            f'База заполнена за {time.monotonic() - started:.1f} с '
+            f'({connection.vendor}).')
+        user = User.objects.annotate(
+            follows=Count('follower')).order_by('-follows').first()
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}')
+        context = self.get_context(user, client)
+        anonymous = APIClient()
+        samples = {name: ([], []) for name, *_ in ENDPOINTS}
+        statuses = {}
+        for run in range(options['warmup'] + options['repeat']):
+            for name, method, path, body, is_anonymous, _ in ENDPOINTS:
+                request = getattr(anonymous if is_anonymous else client,
+                                  method)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = request(
+                        path.format(**context),
+                        context[body] if body else None, format='json')
+                    duration = time.perf_counter() - started
+                if response.status_code >= 400:
+                    statuses[name] = response.status_code
+                if run >= options['warmup']:
+                    samples[name][0].append(len(queries))
+                    samples[name][1].append(duration * 1000)
+        return self.report(samples, statuses)
+
+    def get_context(self, user, client):
+        tag = Tag.objects.first()
+        ingredients = list(Ingredient.objects.values_list(
+            'pk', flat=True)[:5])
+        recipe_body = {
+            'name': 'Тестовый рецепт',
+            'text': 'Описание тестового рецепта',
+            'cooking_time': 30,
+            'image': png(),
+            'tags': [tag.pk],
+            'ingredients': [
+                {'id': ingredient, 'amount': 10} for ingredient in ingredients
+            ],
+        }
+        own_recipe = client.post(
+            '/api/recipes/', recipe_body, format='json').data['id']
+        return {
+            'tag': tag.slug,
+            'recipe': Recipe.objects.order_by('-favorites_count').first().pk,
+            'own_recipe': own_recipe,
+            'other_recipe': Recipe.objects.exclude(
+                favorites__user=user).exclude(
+                shopping_list__user=user).first().pk,
+            'other_author': User.objects.exclude(pk=user.pk).exclude(
+                pk__in=Follow.objects.filter(user=user).values('author')
+            ).first().pk,
+            'recipe_body': recipe_body,
+            'update_body': {
+                key: value for key, value in recipe_body.items()
+                if key != 'image'
+            },
+            'cook_body': {'ingredients': ingredients},
+        }
+
+    def report(self, samples, statuses):
+        failures = []
+        self.stdout.write(
+            f'{"эндпоинт":<26} {"SQL":>5} {"лимит":>6} '
+            f'{"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9}')
+        for name, *_, limit in ENDPOINTS:
+            queries, durations = samples[name]
+            line = (
+                f'{name:<26} {max(queries):>5} {limit:>6} '
+                f'{percentile(durations, 50):>9.1f} '
+                f'{percentile(durations, 95):>9.1f} '
+                f'{percentile(durations, 99):>9.1f}'
+            )
+            if name in statuses:
+                failures.append(f'{name} (HTTP {statuses[name]})')
+                line = self.style.ERROR(line)
+            elif max(queries) > limit:
+                failures.append(f'{name} ({max(queries)} > {limit})')
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        return failures
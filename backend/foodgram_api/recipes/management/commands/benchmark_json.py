@@ -0,0 +1,143 @@
+import time
+
+from api.renderers import ORJSONRenderer
+from api.rows import recipe_cards, subscription_rows
+from api.serializers import (AvailableIngredientsSerializer,
+                             IngredientSerializer, RecipeCreateSerializer,
+                             RecipeReadSerializer, SubscribeSerializer,
+                             TagSerializer)
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import BooleanField, Count, Value
+from recipes.models import Ingredient, Recipe, Tag, User
+from recipes.seeding import seed, temporary_database
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from .benchmark import percentile
+
+# Ошибки ListField - словари с целыми ключами, полезно сравнить и их.
+INVALID_RECIPE = {
+    'tags': ['x'],
+    'ingredients': [{'id': 'y', 'amount': 1}],
+    'cooking_time': 'z',
+}
+INVALID_INGREDIENTS = {'ingredients': [1, 'y']}
+
+
+def validation_errors(serializer_class, data, context):
+    serializer = serializer_class(data=data, context=context)
+    serializer.is_valid()
+    return serializer.errors
+
+
+class Command(BaseCommand):
+    help = ('Сравнить сериализаторы DRF с JSONRenderer и построение ответов '
+            'из .values() с ORJSONRenderer на сгенерированных данных.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--follows', type=int, default=5000)
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100,
+            help='Сколько рецептов и подписок сериализовать за раз.',
+        )
+        parser.add_argument('--recipes-limit', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            seed(users=options['users'], ingredients=options['ingredients'],
+                 recipes=options['recipes'], favorites=0, carts=0,
+                 follows=options['follows'])
+            mismatches = self.benchmark(options)
+        if mismatches:
+            raise CommandError(
+                'Ответы быстрого пути отличаются: ' + ', '.join(mismatches))
+
+    def get_cases(self, options):
+        """Название, сериализатор DRF и построитель строк для эндпоинта."""
+        request = APIRequestFactory().get('/api/')
+        context = {'request': request}
+        limit = options['limit']
+        recipes_limit = options['recipes_limit']
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True)[:limit])
+        follower = User.objects.annotate(
+            follows=Count('follower')).order_by('-follows').first()
+        authors = User.objects.filter(
+            following__user=follower).order_by('id')[:limit]
+
+        def errors():
+            return [
+                validation_errors(
+                    RecipeCreateSerializer, INVALID_RECIPE, context),
+                validation_errors(
+                    AvailableIngredientsSerializer, INVALID_INGREDIENTS,
+                    context),
+            ]
+
+        return (
+            (
+                'recipes list',
+                lambda: RecipeReadSerializer(
+                    Recipe.objects.for_read(AnonymousUser()).filter(
+                        pk__in=recipe_ids),
+                    many=True, context=context).data,
+                lambda: list(recipe_cards(recipe_ids, request).values()),
+            ),
+            (
+                'tags',
+                lambda: TagSerializer(Tag.objects.all(), many=True).data,
+                lambda: list(
+                    Tag.objects.values(*TagSerializer.Meta.fields)),
+            ),
+            (
+                'ingredients',
+                lambda: IngredientSerializer(
+                    Ingredient.objects.all(), many=True).data,
+                lambda: list(Ingredient.objects.values(
+                    *IngredientSerializer.Meta.fields)),
+            ),
+            (
+                'subscriptions',
+                lambda: SubscribeSerializer(
+                    authors.with_recipes_preview(recipes_limit).annotate(
+                        is_subscribed=Value(
+                            True, output_field=BooleanField())),
+                    many=True, context=context).data,
+                lambda: subscription_rows(list(authors), recipes_limit),
+            ),
+            ('validation errors', errors, errors),
+        )
+
+    @staticmethod
+    def measure(build, renderer, repeat):
+        """Время построения данных и рендеринга, мс, и байты ответа."""
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = renderer.render(build())
+            durations.append((time.perf_counter() - started) * 1000)
+        return percentile(durations, 50), content
+
+    def benchmark(self, options):
+        mismatches = []
+        self.stdout.write(
+            f'{"эндпоинт":<18} {"DRF, мс":>9} {"values, мс":>11} '
+            f'{"ускорение":>10}')
+        for name, serialize, build in self.get_cases(options):
+            slow, expected = self.measure(
+                serialize, JSONRenderer(), options['repeat'])
+            fast, content = self.measure(
+                build, ORJSONRenderer(), options['repeat'])
+            line = (f'{name:<18} {slow:>9.2f} {fast:>11.2f} '
+                    f'{slow / fast:>9.1f}x')
+            if content != expected:
+                mismatches.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        return mismatches
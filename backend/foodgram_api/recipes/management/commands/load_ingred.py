@@ -1,17 +1,93 @@
+import csv
 import json
+import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.cache import touch_ingredients
 from recipes.models import Ingredient
 
+DEFAULT_PATH = 'data/ingredients.json'
+FORMATS = ('json', 'jsonl', 'csv')
+
+
+def read_json(file):
+    """Файл-массив: стандартный json не умеет читать его по частям."""
+    for row in json.load(file):
+        yield row['name'], row['measurement_unit']
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            row = json.loads(line)
+            yield row['name'], row['measurement_unit']
+
+
+def read_csv(file):
+    for name, measurement_unit in csv.reader(file):
+        yield name, measurement_unit
+
+
+READERS = {'json': read_json, 'jsonl': read_jsonl, 'csv': read_csv}
+
 
 class Command(BaseCommand):
     help = ' Загрузить данные ингредиентов.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='Файл с ингредиентами (json, jsonl или csv).',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки для bulk_create.',
+        )
+
     def handle(self, *args, **options):
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.'))
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+        started = time.monotonic()
         self.stdout.write(self.style.WARNING('Начало команды.'))
-        with open('data/ingredients.json', encoding='utf-8',
-                  ) as data_file_ingredients:
-            ingredient_data = json.loads(data_file_ingredients.read())
-            for ingredients in ingredient_data:
-                Ingredient.objects.get_or_create(**ingredients)
-        self.stdout.write(self.style.SUCCESS('Ингридиенты загружены!'))
+        seen = set(Ingredient.objects.values_list('name', 'measurement_unit'))
+        total = 0
+        batch = []
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            # Строки, пропущенные ignore_conflicts, bulk_create не сообщает,
+            # поэтому добавленные считаются по числу записей до и после.
+            existing = Ingredient.objects.count()
+            for name, measurement_unit in READERS[file_format](file):
+                total += 1
+                key = (name.strip(), measurement_unit.strip())
+                if key in seen:
+                    continue
+                seen.add(key)
+                batch.append(
+                    Ingredient(name=key[0], measurement_unit=key[1]))
+                if len(batch) >= batch_size:
+                    self.flush(batch, batch_size)
+                    self.stdout.write(f'Обработано строк: {total}')
+            self.flush(batch, batch_size)
+            created = Ingredient.objects.count() - existing
+        if created:
+            touch_ingredients()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингридиенты загружены! Строк: {total}, добавлено: {created}, '
+            f'время: {time.monotonic() - started:.2f} с.'
+        ))
+
+    @staticmethod
+    def flush(batch, batch_size):
+        Ingredient.objects.bulk_create(
+            batch, batch_size=batch_size, ignore_conflicts=True)
+        batch.clear()
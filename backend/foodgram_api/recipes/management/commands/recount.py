@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import recount
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart, User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать счётчики избранного, корзин, рецептов и подписчиков.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            recount(User, Recipe, Favorite, ShoppingCart, Follow)
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны за {time.monotonic() - started:.2f} с.'))
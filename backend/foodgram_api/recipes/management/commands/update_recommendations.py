@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.recommendations import TOP_K, update_recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать похожие рецепты для ленты рекомендаций '
+            '(запускать по cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help='Сколько похожих рецептов хранить для каждого рецепта.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = update_recommendations(options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено {count} пар похожих рецептов '
+            f'за {time.monotonic() - started:.2f} с.'))
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать рейтинг популярности рецептов (запускать по cron).'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = update_trending()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг обновлён для {count} рецептов '
+            f'за {time.monotonic() - started:.2f} с.'))
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', recipes.models.UserManager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+from recipes.counters import recount
+
+
+def recount_counters(apps, schema_editor):
+    recount(
+        apps.get_model('recipes', 'User'),
+        apps.get_model('recipes', 'Recipe'),
+        apps.get_model('recipes', 'Favorite'),
+        apps.get_model('recipes', 'ShoppingCart'),
+        apps.get_model('recipes', 'Follow'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(recount_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes.fulltext import create_index, drop_index, update_search_index
+
+
+def create_search_index(apps, schema_editor):
+    create_index(schema_editor)
+    update_search_index(apps.get_model('recipes', 'Recipe').objects.all())
+
+
+def drop_search_index(apps, schema_editor):
+    drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_tags_tag_recipe_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
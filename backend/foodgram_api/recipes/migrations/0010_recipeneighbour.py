@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='recipes.recipe')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['neighbour', 'recipe'], name='recipe_neighbour_reverse_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipeneighbour',
+            constraint=models.UniqueConstraint(fields=('recipe', 'neighbour'), name='recipe_neighbour_unique'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    follows = Follow.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).values_list('user_id', 'author_id')
+    for user_id, author_id in list(follows):
+        FeedItem.objects.bulk_create(
+            [
+                FeedItem(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in Recipe.objects.filter(
+                    author_id=author_id).values_list('pk', flat=True)
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipeneighbour'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='feed_item_unique'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_pub_date(apps, schema_editor):
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedItem.objects.update(pub_date=Subquery(
+        Recipe.objects.filter(pk=OuterRef('recipe')).values('pub_date')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feeditem',
+            name='pub_date',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_pub_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='feeditem',
+            name='pub_date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'),
+        ),
+    ]
@@ -1,8 +1,42 @@
 from colorfield.fields import ColorField
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              UniqueConstraint, Value)
+
+
+class UserQuerySet(models.QuerySet):
+
+    def with_is_subscribed(self, user):
+        """Аннотирует флаг подписки пользователя user на автора."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+    def with_recipes_preview(self, recipes_limit):
+        """Подгружает recipes_limit последних рецептов каждого автора.
+
+        Срез в Prefetch выполняется одним запросом с ROW_NUMBER() по автору.
+        """
+        return self.prefetch_related(Prefetch(
+            'recipe_set',
+            queryset=Recipe.objects.only(
+                'id', 'author', 'name', 'image', 'image_variants',
+                'cooking_time',
+            )[:recipes_limit],
+            to_attr='recipes_preview',
+        ))
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
 
 
 class User(AbstractUser):
@@ -42,6 +76,18 @@ class User(AbstractUser):
         blank=True
     )
 
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+
+    objects = UserManager()
+
     class Meta:
         ordering = ('id',)
         verbose_name = 'Пользователь'
@@ -130,6 +176,70 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного и списка покупок для user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def for_read(self, user):
+        """Queryset для чтения рецептов с фиксированным числом запросов."""
+        return self.with_user_flags(user).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user),
+            ),
+            'tags',
+            Prefetch(
+                'ingredienttorecipe',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+
+    def for_fields(self, user, fields, expand):
+        """Как for_read, но только для полей ответа fields.
+
+        Аннотации и подгрузка остальных полей не выполняются, вложенные
+        объекты не из expand подгружаются одними идентификаторами.
+        """
+        queryset = self
+        if 'is_favorited' in fields or 'is_in_shopping_cart' in fields:
+            queryset = queryset.with_user_flags(user)
+        if 'text' not in fields:
+            queryset = queryset.defer('text')
+        prefetches = []
+        if 'author' in fields and 'author' in expand:
+            prefetches.append(Prefetch(
+                'author', queryset=User.objects.with_is_subscribed(user)))
+        if 'tags' in fields:
+            prefetches.append(Prefetch(
+                'tags',
+                queryset=(Tag.objects.all() if 'tags' in expand
+                          else Tag.objects.only('id')),
+            ))
+        if 'ingredients' in fields:
+            prefetches.append(Prefetch(
+                'ingredienttorecipe',
+                queryset=(
+                    IngredientRecipe.objects.select_related('ingredient')
+                    if 'ingredients' in expand
+                    else IngredientRecipe.objects.only('recipe', 'ingredient')
+                ),
+            ))
+        return queryset.prefetch_related(*prefetches)
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -141,6 +251,11 @@ class Recipe(models.Model):
     image = models.ImageField(
         upload_to='recipes/image/',
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField()
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -154,9 +269,49 @@ class Recipe(models.Model):
         auto_now_add=True,
     )
     cooking_time = models.BigIntegerField()
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_idx',
+            ),
+            models.Index(
+                fields=('cooking_time', 'id'),
+                name='recipe_cooking_time_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -171,6 +326,10 @@ class FavoriteShoppingCart(models.Model):
         Recipe,
         on_delete=models.CASCADE,
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         abstract = True
@@ -220,3 +379,74 @@ class IngredientRecipe(models.Model):
             f'{self.ingredient.name} :: {self.ingredient.measurement_unit}'
             f' - {self.amount} '
         )
+
+
+class RecipeNeighbour(models.Model):
+    """Похожий рецепт: его часто добавляют в избранное и список покупок
+    вместе с исходным. Заполняется командой update_recommendations."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=('recipe', 'neighbour'),
+                name='recipe_neighbour_unique',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('neighbour', 'recipe'),
+                name='recipe_neighbour_reverse_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} -> {self.neighbour}'
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписчика, записывается при публикации рецепта.
+
+    Дата публикации скопирована из рецепта, чтобы страница ленты читалась
+    по индексу (user, -pub_date, -recipe) без обхода всех рецептов. Для
+    авторов с числом подписчиков больше FEED_FANOUT_LIMIT записи не
+    создаются: их рецепты подмешиваются в ленту при чтении.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='feed_item_unique',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_item_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} :: {self.recipe}'
@@ -0,0 +1,106 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import (Case, Exists, OuterRef, Q, Subquery, Sum, Value,
+                              When)
+from django.db.models.functions import Coalesce
+from scipy import sparse
+
+from .models import Favorite, Follow, RecipeNeighbour, ShoppingCart
+
+TOP_K = 20
+WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 0.5),
+)
+FOLLOW_WEIGHT = 0.5
+BATCH_SIZE = 1000
+
+
+def interactions():
+    """Пары (пользователь, рецепт) и веса взаимодействий."""
+    pairs = []
+    weights = []
+    for model, weight in WEIGHTS:
+        rows = np.array(
+            list(model.objects.values_list('user_id', 'recipe_id').iterator(
+                chunk_size=BATCH_SIZE)),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        pairs.append(rows)
+        weights.append(np.full(len(rows), weight))
+    return np.concatenate(pairs), np.concatenate(weights)
+
+
+def compute_neighbours(top_k=TOP_K):
+    """Для каждого рецепта top_k рецептов с наибольшей косинусной
+    близостью столбцов матрицы пользователь x рецепт."""
+    pairs, weights = interactions()
+    if not len(pairs):
+        return []
+    users, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    recipes, recipe_index = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (weights, (user_index, recipe_index)),
+        shape=(len(users), len(recipes)),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    matrix = matrix @ sparse.diags(1 / norms)
+    similarity = (matrix.T @ matrix).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    neighbours = []
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        columns = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            columns, scores = columns[best], scores[best]
+        neighbours.extend(
+            RecipeNeighbour(
+                recipe_id=int(recipes[row]),
+                neighbour_id=int(recipes[column]),
+                score=float(score),
+            )
+            for column, score in zip(columns, scores)
+        )
+    return neighbours
+
+
+@transaction.atomic
+def update_recommendations(top_k=TOP_K):
+    """Перезаписывает таблицу похожих рецептов, возвращает число пар."""
+    neighbours = compute_neighbours(top_k)
+    RecipeNeighbour.objects.all().delete()
+    RecipeNeighbour.objects.bulk_create(neighbours, batch_size=BATCH_SIZE)
+    return len(neighbours)
+
+
+def recommended_recipes(queryset, user):
+    """Рецепты, похожие на избранное и список покупок пользователя, и
+    рецепты авторов из его подписок, лучшие первыми."""
+    favorites = Favorite.objects.filter(user=user).values('recipe')
+    carts = ShoppingCart.objects.filter(user=user).values('recipe')
+    follows = Follow.objects.filter(user=user)
+    neighbours = RecipeNeighbour.objects.filter(
+        Q(recipe__in=favorites) | Q(recipe__in=carts))
+    score = Coalesce(Subquery(
+        neighbours.filter(
+            neighbour=OuterRef('pk')
+        ).order_by().values('neighbour').annotate(
+            total=Sum('score')
+        ).values('total')
+    ), 0.0)
+    followed = Case(
+        When(Exists(follows.filter(author=OuterRef('author'))),
+             then=Value(FOLLOW_WEIGHT)),
+        default=Value(0.0),
+    )
+    return queryset.filter(
+        Q(pk__in=neighbours.values('neighbour'))
+        | Q(author__in=follows.values('author'))
+    ).exclude(
+        Q(pk__in=favorites) | Q(pk__in=carts) | Q(author=user)
+    ).annotate(
+        recommendation_score=score + followed
+    ).order_by('-recommendation_score', '-trending_score', '-id')
@@ -0,0 +1,171 @@
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from .counters import recount
+from .fulltext import update_search_index
+from .models import (Favorite, FeedItem, Follow, Ingredient, IngredientRecipe,
+                     Recipe, ShoppingCart, Tag, User)
+from .recommendations import update_recommendations
+from .trending import update_trending
+
+BATCH_SIZE = 1000
+PASSWORD = 'benchmark-password'
+IMAGE = 'recipes/image/seed.png'
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'омлет', 'паста',
+    'соус', 'котлеты', 'блины', 'плов', 'борщ', 'десерт', 'хлеб', 'курица',
+    'говядина', 'рыба', 'овощи', 'грибы', 'сыр', 'томаты', 'картофель',
+)
+
+
+@contextmanager
+def temporary_database():
+    """Тестовая база, медиа-каталог и кэш на время замеров.
+
+    Кэш файловый: как и Redis, он общий для процессов, поэтому замеры
+    идут по тому же пути, что и в рабочей конфигурации.
+    """
+    old_name = connection.settings_dict['NAME']
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            # Файл, а не память: изображения обрабатываются в потоках.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                directory, 'benchmark.sqlite3')
+        caches = {
+            'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': os.path.join(directory, 'cache'),
+            }
+        }
+        with override_settings(MEDIA_ROOT=directory, CACHES=caches):
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+            try:
+                yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def sample_pairs(rng, left, right, count, exclude_same=False):
+    """count случайных неповторяющихся пар из двух списков id."""
+    total = len(left) * len(right)
+    if exclude_same:
+        total -= len(set(left) & set(right))
+    count = min(count, total)
+    pairs = set()
+    while len(pairs) < count:
+        pair = (rng.choice(left), rng.choice(right))
+        if not (exclude_same and pair[0] == pair[1]):
+            pairs.add(pair)
+    return pairs
+
+
+@transaction.atomic
+def seed(users=2000, ingredients=2000, tags=10, recipes=5000,
+         ingredients_per_recipe=(3, 10), favorites=20000, carts=5000,
+         follows=20000, random_seed=0):
+    """Заполняет базу случайными данными через bulk_create.
+
+    Сигналы при массовой вставке не срабатывают, поэтому счётчики,
+    ленты, поисковый индекс и рейтинги пересчитываются в конце.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        [
+            User(username=f'user{i}', email=f'user{i}@example.com',
+                 first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                 password=password)
+            for i in range(users)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    Ingredient.objects.bulk_create(
+        [
+            Ingredient(name=f'{rng.choice(WORDS)} {i}',
+                       measurement_unit=rng.choice(UNITS))
+            for i in range(ingredients)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    Tag.objects.bulk_create([
+        Tag(name=f'Тег {i}', color=f'#{rng.randrange(0x1000000):06X}',
+            slug=f'tag-{i}')
+        for i in range(tags)
+    ])
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    tag_ids = list(Tag.objects.values_list('pk', flat=True))
+    Recipe.objects.bulk_create(
+        [
+            Recipe(author_id=rng.choice(user_ids),
+                   name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                   text=' '.join(rng.choices(WORDS, k=40)),
+                   image=IMAGE, cooking_time=rng.randint(5, 180))
+            for _ in range(recipes)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+    Recipe.tags.through.objects.bulk_create(
+        [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, min(3, tags)))
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    IngredientRecipe.objects.bulk_create(
+        [
+            IngredientRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids,
+                min(rng.randint(*ingredients_per_recipe), len(ingredient_ids)),
+            )
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    for model, count in ((Favorite, favorites), (ShoppingCart, carts)):
+        model.objects.bulk_create(
+            [
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in sample_pairs(
+                    rng, user_ids, recipe_ids, count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    Follow.objects.bulk_create(
+        [
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in sample_pairs(
+                rng, user_ids, user_ids, follows, exclude_same=True)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    recount(User, Recipe, Favorite, ShoppingCart, Follow)
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id, recipe_id, pub_date in Follow.objects.filter(
+                author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+                author__recipe__isnull=False,
+            ).values_list(
+                'user_id', 'author__recipe', 'author__recipe__pub_date'
+            ).iterator()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    update_search_index(Recipe.objects.all())
+    update_trending()
+    update_recommendations()
@@ -0,0 +1,177 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import feed
+from .cache import (log_recipe_changes, token_cache, token_digest,
+                    touch_ingredients, touch_recipes, touch_shopping_carts,
+                    touch_tags)
+from .fulltext import remove_from_search_index, update_search_index
+from .images import schedule_variants
+from .models import (Favorite, Follow, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, Tag, User)
+
+AUTHOR_CARD_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+def increment(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def delta(signal, kwargs):
+    if signal is post_delete:
+        return -1
+    return 1 if kwargs['created'] else 0
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorites_count_changed(sender, instance, signal, **kwargs):
+    change = delta(signal, kwargs)
+    if change:
+        increment(Recipe, instance.recipe_id, 'favorites_count', change)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def in_carts_count_changed(sender, instance, signal, **kwargs):
+    change = delta(signal, kwargs)
+    if change:
+        increment(Recipe, instance.recipe_id, 'in_carts_count', change)
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def followers_count_changed(sender, instance, signal, **kwargs):
+    change = delta(signal, kwargs)
+    if change:
+        increment(User, instance.author_id, 'followers_count', change)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipes_count_changed(sender, instance, signal, **kwargs):
+    change = delta(signal, kwargs)
+    if change:
+        increment(User, instance.author_id, 'recipes_count', change)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    touch_shopping_carts([instance.user_id])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_shopping_carts(
+            instance.shopping_list.values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    if (instance.image
+            and instance.image_variants.get('source') != instance.image.name):
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_card_changed(sender, instance, **kwargs):
+    touch_recipes([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    touch_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        touch_recipes((pk_set or ()) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """Данные автора входят в карточки его рецептов; обновление
+    last_login при входе карточки не затрагивает."""
+    if created or (update_fields is not None
+                   and not update_fields & AUTHOR_CARD_FIELDS):
+        return
+    touch_recipes(
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_changed(sender, instance, **kwargs):
+    """Индекс обновляется после фиксации: ингредиенты нового рецепта
+    сохраняются уже после самого рецепта."""
+    transaction.on_commit(
+        lambda: update_search_index(Recipe.objects.filter(pk=instance.pk)))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_search_deleted(sender, instance, **kwargs):
+    remove_from_search_index(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        feed.publish(instance)
+
+
+@receiver(post_save, sender=Follow)
+def feed_followed(sender, instance, created, **kwargs):
+    if created:
+        feed.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def feed_unfollowed(sender, instance, **kwargs):
+    feed.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    log_recipe_changes([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_search_changed(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: update_search_index(
+            Recipe.objects.filter(ingredients=instance).distinct()))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_shopping_carts(ShoppingCart.objects.filter(
+            recipe__ingredients=instance
+        ).values_list('user_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_catalogue_changed(sender, **kwargs):
+    touch_ingredients()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_catalogue_changed(sender, **kwargs):
+    touch_tags()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход через djoser удаляет токен, удаление пользователя тоже."""
+    token_cache.invalidate([token_digest(instance.key)])
+
+
+@receiver(post_save, sender=User)
+def user_tokens_changed(sender, instance, created, update_fields, **kwargs):
+    """Пользователь хранится в кэше вместе с токеном: смена пароля,
+    блокировка и правка профиля сбрасывают его токены."""
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    token_cache.invalidate(
+        token_digest(key) for key in Token.objects.filter(
+            user=instance).values_list('key', flat=True))
@@ -0,0 +1,36 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Пул фоновых задач процесса: копии изображений, дополнение лент. При
+# BACKGROUND_WORKERS=0 задачи выполняются сразу после фиксации транзакции
+# в том же потоке (удобно для тестов и команд).
+executor = (
+    ThreadPoolExecutor(
+        max_workers=settings.BACKGROUND_WORKERS,
+        thread_name_prefix='background-tasks',
+    ) if settings.BACKGROUND_WORKERS else None
+)
+
+
+def run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s%s завершилась с ошибкой',
+                         func.__name__, args)
+    finally:
+        if executor is not None:
+            connection.close()
+
+
+def schedule(func, *args):
+    """Ставит задачу в пул после фиксации текущей транзакции."""
+    if executor is None:
+        transaction.on_commit(lambda: run(func, *args))
+    else:
+        transaction.on_commit(lambda: executor.submit(run, func, *args))
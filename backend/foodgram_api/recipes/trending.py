@@ -0,0 +1,46 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Favorite, Recipe, ShoppingCart
+
+HALF_LIFE = timedelta(days=3)
+WINDOW = timedelta(days=30)
+WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 0.5),
+)
+BATCH_SIZE = 1000
+
+
+def compute_scores(now=None):
+    """Сумма весов событий с экспоненциальным затуханием по возрасту.
+
+    Учитываются только события за WINDOW: более старые дают вклад
+    меньше 2 ** -(WINDOW / HALF_LIFE) и на порядок не влияют.
+    """
+    now = now or timezone.now()
+    scores = defaultdict(float)
+    for model, weight in WEIGHTS:
+        events = model.objects.filter(
+            created__gte=now - WINDOW
+        ).values_list('recipe_id', 'created').iterator(chunk_size=BATCH_SIZE)
+        for recipe_id, created in events:
+            scores[recipe_id] += weight * 0.5 ** ((now - created) / HALF_LIFE)
+    return scores
+
+
+@transaction.atomic
+def update_trending(now=None):
+    """Записывает рейтинг в Recipe.trending_score, возвращает число
+    рецептов с ненулевым рейтингом."""
+    scores = compute_scores(now)
+    Recipe.objects.filter(trending_score__gt=0).update(trending_score=0)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, trending_score=score) for pk, score in scores.items()],
+        ['trending_score'],
+        batch_size=BATCH_SIZE,
+    )
+    return len(scores)